@@ -1,14 +1,127 @@
-import requests
+import asyncio
+import copy
+from datetime import datetime, timezone
+import functools
+import httpx
+import orjson
+import random
 import re
+import time
 from urllib.parse import urlparse
-import json
 
 GAMMA_API = "https://gamma-api.polymarket.com"
 
+_SLUG_RE = re.compile(r'/(?:event|market)/([^/?]+)')
+
+_HEADERS = {
+    "User-Agent": "lockd-polymarket-fetcher",
+    "Accept": "application/json"
+}
+
+# Shared HTTP/2 client so repeated lookups reuse one pooled keep-alive connection
+_CLIENT = httpx.Client(
+    http2=True,
+    timeout=10.0,
+    headers=_HEADERS,
+    limits=httpx.Limits(max_connections=10, max_keepalive_connections=4)
+)
+
+# Options for the async client; long-running callers should create one
+# httpx.AsyncClient with these and pass it to fetch_polymarket_data_async
+ASYNC_CLIENT_OPTIONS = {
+    "http2": True,
+    "timeout": 10.0,
+    "headers": _HEADERS,
+    "limits": httpx.Limits(max_keepalive_connections=10)
+}
+
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+CACHE_TTL = 60.0
+CACHE_MAX_SIZE = 512
+
+# slug -> (expiry timestamp, formatted result)
+_CACHE = {}
+
+def _backoff_delay(attempt):
+    """Exponential backoff with jitter for the given retry attempt"""
+    delay = RETRY_BASE_DELAY * 2 ** attempt * (1 + random.random() * 0.5)
+    return min(delay, RETRY_MAX_DELAY)
+
+def _get_with_retry(url, params):
+    """GET with retries on rate limits, 5xx responses and transient network errors"""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = _CLIENT.get(url, params=params)
+        except httpx.TransportError:
+            if attempt == MAX_RETRIES:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                return response
+        time.sleep(_backoff_delay(attempt))
+
+async def _async_get_with_retry(client, url, params):
+    """Async counterpart of _get_with_retry using an httpx.AsyncClient"""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = await client.get(url, params=params)
+        except httpx.TransportError:
+            if attempt == MAX_RETRIES:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                return response
+        await asyncio.sleep(_backoff_delay(attempt))
+
+def _get_cached(slug):
+    """Return a copy of the cached result for slug, or None if missing or expired"""
+    entry = _CACHE.get(slug)
+    if entry is None:
+        return None
+    expires_at, data = entry
+    if expires_at < time.monotonic():
+        del _CACHE[slug]
+        return None
+    return copy.deepcopy(data)
+
+def _seconds_until_end(data):
+    """Seconds left until the result's end_date, or None if it has no parseable end_date"""
+    end_date = data.get("end_date")
+    if not isinstance(end_date, str):
+        return None
+    try:
+        end = datetime.fromisoformat(end_date.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    return (end - datetime.now(timezone.utc)).total_seconds()
+
+def _set_cached(slug, data):
+    """Cache a successful result for an open market/event, never past its end_date"""
+    if "error" in data or data.get("closed"):
+        return data
+
+    ttl = CACHE_TTL
+    remaining = _seconds_until_end(data)
+    if remaining is not None:
+        if remaining <= 0:
+            return data
+        ttl = min(ttl, remaining)
+
+    if slug not in _CACHE and len(_CACHE) >= CACHE_MAX_SIZE:
+        del _CACHE[next(iter(_CACHE))]
+    _CACHE[slug] = (time.monotonic() + ttl, copy.deepcopy(data))
+    return data
+
+@functools.lru_cache(maxsize=1024)
 def extract_slug(url):
     """Extract event/market slug from Polymarket URL"""
-    path = urlparse(url).path
-    match = re.search(r'/event/([^/?]+)', path) or re.search(r'/market/([^/?]+)', path)
+    match = _SLUG_RE.search(urlparse(url).path)
     return match.group(1) if match else None
 
 def fetch_polymarket_data(url):
@@ -17,28 +130,93 @@ def fetch_polymarket_data(url):
     if not slug:
         return {"error": "Invalid Polymarket URL format"}
 
+    cached = _get_cached(slug)
+    if cached is not None:
+        return cached
+
+    return _set_cached(slug, _fetch_slug(slug))
+
+def _fetch_slug(slug):
+    """Look up a slug on the events endpoint, falling back to markets"""
     # Try to find matching event first
-    event_response = requests.get(
+    event_response = _get_with_retry(
         f"{GAMMA_API}/events",
-        params={"slug": slug, "closed": "false", "archived": "false"}
+        {"slug": slug, "closed": "false", "archived": "false"}
     )
     
-    if event_response.status_code == 200 and event_response.json():
-        event = event_response.json()[0]
-        return format_event_data(event)
+    if event_response.status_code == 200:
+        events = orjson.loads(event_response.content)
+        if events:
+            return format_event_data(events[0])
 
     # If no event found, try markets endpoint
-    market_response = requests.get(
+    market_response = _get_with_retry(
         f"{GAMMA_API}/markets",
-        params={"slug": slug, "closed": "false", "archived": "false"}
+        {"slug": slug, "closed": "false", "archived": "false"}
     )
     
-    if market_response.status_code == 200 and market_response.json():
-        market = market_response.json()[0]
-        return format_market_data(market)
+    if market_response.status_code == 200:
+        markets = orjson.loads(market_response.content)
+        if markets:
+            return format_market_data(markets[0])
 
     return {"error": "No matching event or market found"}
 
+async def fetch_polymarket_data_async(url, client=None):
+    """Fetch market/event data, querying the events and markets endpoints concurrently"""
+    slug = extract_slug(url)
+    if not slug:
+        return {"error": "Invalid Polymarket URL format"}
+
+    cached = _get_cached(slug)
+    if cached is not None:
+        return cached
+
+    if client is None:
+        async with httpx.AsyncClient(**ASYNC_CLIENT_OPTIONS) as client:
+            return _set_cached(slug, await _fetch_slug_async(client, slug))
+
+    return _set_cached(slug, await _fetch_slug_async(client, slug))
+
+async def _fetch_slug_async(client, slug):
+    """Look up a slug on the events and markets endpoints concurrently"""
+    params = {"slug": slug, "closed": "false", "archived": "false"}
+    # The markets lookup runs in the background and is only awaited if the event misses
+    market_task = asyncio.create_task(
+        _async_get_with_retry(client, f"{GAMMA_API}/markets", params)
+    )
+    try:
+        event_error = None
+        try:
+            event_response = await _async_get_with_retry(client, f"{GAMMA_API}/events", params)
+        except httpx.TransportError as e:
+            event_error = e
+        else:
+            if event_response.status_code == 200:
+                events = orjson.loads(event_response.content)
+                if events:
+                    return format_event_data(events[0])
+
+        try:
+            market_response = await market_task
+        except httpx.TransportError:
+            if event_error is not None:
+                raise event_error
+            raise
+
+        if market_response.status_code == 200:
+            markets = orjson.loads(market_response.content)
+            if markets:
+                return format_market_data(markets[0])
+
+        if event_error is not None:
+            raise event_error
+        return {"error": "No matching event or market found"}
+    finally:
+        # Stop retrying markets once an event matched, and retrieve any exception it left
+        market_task.cancel()
+        await asyncio.gather(market_task, return_exceptions=True)
+
 def format_event_data(event):
     """Structure event data from Gamma API response"""
     return {
@@ -54,27 +232,37 @@ def format_event_data(event):
 
 def format_market_data(market):
     """Structure market data from Gamma API response"""
+    _normalize_market(market)
+    answer_options = get_answer_options(market)
     return {
         "type": "market",
         "id": market["id"],
         "question": market["question"],
         "end_date": market.get("endDate"),
-        "answer_options": get_answer_options(market),
-        "current_prices": parse_outcome_prices(market),
+        "answer_options": answer_options,
+        "current_prices": parse_outcome_prices(market, answer_options),
         "active": market.get("active"),
         "closed": market.get("closed"),
         "url": f"https://polymarket.com/market/{market.get('slug')}"
     }
 
+def _normalize_market(market):
+    """Decode stringified JSON outcome fields in place so they are parsed only once"""
+    if isinstance(market.get("outcomes"), str):
+        try:
+            market["outcomes"] = orjson.loads(market["outcomes"])
+        except orjson.JSONDecodeError:
+            pass
+
+    if isinstance(market.get("outcomePrices"), str):
+        try:
+            market["outcomePrices"] = orjson.loads(market["outcomePrices"])
+        except orjson.JSONDecodeError:
+            market["outcomePrices"] = []
+
 def get_answer_options(market):
-    """Extract human-readable answer options from market data"""
-    # Handle stringified JSON outcomes
+    """Extract human-readable answer options from normalized market data"""
     if "outcomes" in market:
-        if isinstance(market["outcomes"], str):
-            try:
-                return json.loads(market["outcomes"])
-            except json.JSONDecodeError:
-                pass
         return market["outcomes"]
     
     # Fallback to token outcomes if available
@@ -85,30 +273,16 @@ def get_answer_options(market):
     
     # Final fallback based on price count
     prices = market.get("outcomePrices", [])
-    if isinstance(prices, str):
-        try:
-            prices = json.loads(prices)
-        except json.JSONDecodeError:
-            prices = []
     
     if len(prices) == 2:
         return ["Yes", "No"]
     
     return [f"Option {i+1}" for i in range(len(prices))]
 
-def parse_outcome_prices(market):
-    """Parse outcome prices from market data"""
+def parse_outcome_prices(market, answer_options):
+    """Parse outcome prices from normalized market data"""
     prices = market.get("outcomePrices", {})
     
-    # Normalize price format
-    if isinstance(prices, str):
-        try:
-            prices = json.loads(prices)
-        except json.JSONDecodeError:
-            prices = []
-    
-    answer_options = get_answer_options(market)
-    
     if isinstance(prices, list):
         return {
             option: float(price)
@@ -146,17 +320,18 @@ def format_human_readable(data):
 
 def format_market_text(market):
     """Format individual market data"""
-    lines = [
-        f"Market: {market['question']}",
-        f"Ends: {market['end_date']}",
-        "Options:"
+    prices = market.get("current_prices", {})
+    options = [
+        f"> {option} ({prices.get(option, 0.0) * 100:.1f}%)"
+        for option in market.get("answer_options", ())
     ]
     
-    for option in market.get("answer_options", []):
-        price = market["current_prices"].get(option, 0.0)
-        lines.append(f"> {option} ({price * 100:.1f}%)")
-    
-    return "\n".join(lines)
+    return "\n".join([
+        f"Market: {market['question']}",
+        f"Ends: {market['end_date']}",
+        "Options:",
+        *options
+    ])
 
 if __name__ == "__main__":
     import sys
@@ -164,7 +339,7 @@ if __name__ == "__main__":
         print("Usage: python fetch_polymarket.py <polymarket_url>")
         sys.exit(1)
     
-    result = fetch_polymarket_data(sys.argv[1])
-    print(json.dumps(result, indent=2, sort_keys=True))
+    result = asyncio.run(fetch_polymarket_data_async(sys.argv[1]))
+    print(orjson.dumps(result, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS).decode())
     print("\nHuman-readable format:")
     print(format_human_readable(result))
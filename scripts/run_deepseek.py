@@ -1,22 +1,117 @@
 
+import functools
+import importlib.util
+import os
 import sys
-import json
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
 
-def generate_tags(input_text):
-    # Load model and tokenizer
-    model_path = sys.argv[1]
-    
+# orjson is optional; fall back to the stdlib codec when it is not installed
+try:
+    import orjson
+    from orjson import JSONDecodeError, loads as json_loads
+
+    def json_dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    from json import JSONDecodeError, dumps as json_dumps, loads as json_loads
+
+try:
+    from lmformatenforcer import JsonSchemaParser
+    from lmformatenforcer.integrations.transformers import (
+        build_token_enforcer_tokenizer_data,
+        build_transformers_prefix_allowed_tokens_fn
+    )
+except ImportError:
+    JsonSchemaParser = None
+
+# This script only runs inference
+torch.set_grad_enabled(False)
+torch.backends.cudnn.benchmark = True
+
+# Opt-in 4-bit NF4 weights via bitsandbytes; requires a CUDA GPU
+LOAD_IN_4BIT = os.environ.get("DEEPSEEK_LOAD_IN_4BIT") == "true"
+
+# Opt-in torch.compile of the forward pass; compilation only pays off in worker mode
+TORCH_COMPILE = os.environ.get("DEEPSEEK_TORCH_COMPILE") == "true"
+
+# Compiling with a static cache is not supported for bitsandbytes-quantized weights
+if TORCH_COMPILE and LOAD_IN_4BIT:
+    sys.exit("DEEPSEEK_TORCH_COMPILE and DEEPSEEK_LOAD_IN_4BIT cannot be used together")
+
+MAX_NEW_TOKENS = 500
+
+# With torch.compile, prompt lengths are padded to a multiple of this so the static
+# KV cache and CUDA graphs only ever see a handful of shapes
+PROMPT_BUCKET = 256 if TORCH_COMPILE else None
+
+# Prefer FlashAttention-2 when installed, otherwise PyTorch's SDPA, which picks
+# its fused flash/memory-efficient kernels by default. The static cache used with
+# torch.compile does not support FlashAttention-2, so compiling always uses SDPA.
+if TORCH_COMPILE:
+    ATTN_IMPLEMENTATION = "sdpa"
+elif torch.cuda.is_available() and importlib.util.find_spec("flash_attn") is not None:
+    ATTN_IMPLEMENTATION = "flash_attention_2"
+else:
+    ATTN_IMPLEMENTATION = "sdpa"
+
+def load_model(model_path):
+    """Load the model and tokenizer once so they can be reused across requests"""
     tokenizer = AutoTokenizer.from_pretrained(model_path)
+    quantization_config = None
+    if torch.cuda.is_available():
+        torch_dtype = torch.bfloat16
+        if LOAD_IN_4BIT:
+            quantization_config = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_compute_dtype=torch.bfloat16,
+                bnb_4bit_quant_type="nf4"
+            )
+    else:
+        # Most CPUs have no fast bfloat16 path, and bitsandbytes needs CUDA
+        print("Using CPU for inference", file=sys.stderr)
+        torch_dtype = torch.float32
+        if LOAD_IN_4BIT:
+            print("DEEPSEEK_LOAD_IN_4BIT ignored: 4-bit loading requires CUDA", file=sys.stderr)
     model = AutoModelForCausalLM.from_pretrained(
         model_path,
-        torch_dtype=torch.float16,
-        device_map="auto"
+        torch_dtype=torch_dtype,
+        device_map="auto",
+        attn_implementation=ATTN_IMPLEMENTATION,
+        quantization_config=quantization_config
     )
-    
-    # Create prompt
-    prompt = f"""
+    model.eval()
+    # Decoder-only models need left padding so every prompt ends at the same position
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+
+    if JsonSchemaParser is not None:
+        print("Using constrained JSON decoding (lm-format-enforcer)", file=sys.stderr)
+    else:
+        print("lm-format-enforcer not installed, using unconstrained decoding", file=sys.stderr)
+
+    if TORCH_COMPILE:
+        # A static cache keeps KV shapes fixed across decode steps, so the compiled
+        # graphs are reused instead of recompiled for every new sequence length
+        model.generation_config.cache_implementation = "static"
+        model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=False)
+        # Trigger compilation up front with the same shapes as a short real request
+        warmup = tokenizer.pad(
+            {"input_ids": [prefix_ids(tokenizer)]},
+            pad_to_multiple_of=PROMPT_BUCKET,
+            return_tensors="pt"
+        ).to(model.device)
+        with torch.inference_mode():
+            model.generate(
+                **warmup,
+                max_new_tokens=MAX_NEW_TOKENS,
+                do_sample=False,
+                pad_token_id=tokenizer.pad_token_id
+            )
+    return model, tokenizer
+
+PROMPT_PREFIX = """
 You are a tag generation system. Analyze the following content and extract the most relevant tags.
 Focus on:
 1. Current events, trending topics, and newsworthy items
@@ -29,21 +124,78 @@ Each tag should be a single word or short phrase (1-3 words maximum).
 Limit to 30 most relevant tags.
 
 CONTENT:
-{input_text}
 """
 
+# Output grammar used to constrain decoding to a JSON array of strings
+TAGS_SCHEMA = {"type": "array", "items": {"type": "string"}}
+
+@functools.lru_cache(maxsize=None)
+def enforcer_tokenizer_data(tokenizer):
+    """Vocabulary data for lm-format-enforcer, built once per tokenizer"""
+    return build_token_enforcer_tokenizer_data(tokenizer)
+
+def tags_prefix_allowed_tokens_fn(tokenizer):
+    """Restrict generation to TAGS_SCHEMA, or None if lm-format-enforcer is not installed"""
+    if JsonSchemaParser is None:
+        return None
+    return build_transformers_prefix_allowed_tokens_fn(
+        enforcer_tokenizer_data(tokenizer),
+        JsonSchemaParser(TAGS_SCHEMA)
+    )
+
+@functools.lru_cache(maxsize=None)
+def prefix_ids(tokenizer):
+    """Token ids of the static instruction prefix, tokenized once per tokenizer"""
+    return tokenizer(PROMPT_PREFIX)["input_ids"]
+
+def generate_tags(input_texts, model, tokenizer):
+    """Generate tags for a batch of inputs with a single generate call"""
+    prefix = prefix_ids(tokenizer)
+
+    # Leave room in the context for the generated tokens and any bucket padding
+    max_prompt_length = tokenizer.model_max_length - MAX_NEW_TOKENS
+    if PROMPT_BUCKET:
+        max_prompt_length -= max_prompt_length % PROMPT_BUCKET
+
+    # Only the content is tokenized per request; the prefix ids are reused
+    content_ids = tokenizer(
+        [f"{text}\n" for text in input_texts],
+        add_special_tokens=False,
+        truncation=True,
+        max_length=max_prompt_length - len(prefix)
+    )["input_ids"]
+    inputs = tokenizer.pad(
+        {"input_ids": [prefix + ids for ids in content_ids]},
+        pad_to_multiple_of=PROMPT_BUCKET,
+        return_tensors="pt"
+    ).to(model.device)
+
     # Generate tags
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    with torch.no_grad():
+    with torch.inference_mode():
         outputs = model.generate(
-            inputs["input_ids"],
-            max_new_tokens=500,
-            temperature=0.1,
-            do_sample=True
+            **inputs,
+            max_new_tokens=MAX_NEW_TOKENS,
+            do_sample=False,
+            num_beams=1,
+            use_cache=True,
+            pad_token_id=tokenizer.pad_token_id,
+            prefix_allowed_tokens_fn=tags_prefix_allowed_tokens_fn(tokenizer)
         )
     
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    
+    # Prompts are left-padded to the same length, so new tokens start at one offset
+    new_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+    responses = tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+    return [parse_tags(response) for response in responses]
+
+def parse_tags(response):
+    """Pull the tag list out of the generated text"""
+    # Constrained decoding yields a JSON array of strings unless it ran out of tokens
+    if JsonSchemaParser is not None:
+        try:
+            return json_loads(response)
+        except JSONDecodeError:
+            pass
+
     # Extract JSON array from response
     try:
         # Try to find JSON array in the response
@@ -52,24 +204,56 @@ CONTENT:
         
         if start_idx >= 0 and end_idx > start_idx:
             json_str = response[start_idx:end_idx]
-            tags = json.loads(json_str)
+            tags = json_loads(json_str)
             return tags
         else:
             # Fallback: split by commas and clean up
-            cleaned_response = response.replace(prompt, "").strip()
-            tags = [tag.strip() for tag in cleaned_response.split(',') if tag.strip()]
+            tags = [tag.strip() for tag in response.split(',') if tag.strip()]
             return tags
     except Exception as e:
         print(f"Error parsing response: {e}", file=sys.stderr)
         # Last resort fallback
-        words = response.replace(prompt, "").strip().split()
+        words = response.strip().split()
         return [word for word in words if len(word) > 3][:30]
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python run_deepseek.py <model_path> <input_text>")
+    if len(sys.argv) < 2:
+        print("Usage: python run_deepseek.py <model_path> [input_text]", file=sys.stderr)
+        print('Without input_text, reads one {"id": ..., "input": text or [texts]} JSON object per line from stdin', file=sys.stderr)
         sys.exit(1)
     
-    input_text = sys.argv[2]
-    tags = generate_tags(input_text)
-    print(json.dumps(tags))
+    # Only replies go to the real stdout. Everything else, including output from
+    # libraries and native code, is redirected to stderr so it can't be read as a reply.
+    sys.stdout.flush()
+    responses = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+    
+    model, tokenizer = load_model(sys.argv[1])
+    
+    if len(sys.argv) > 2:
+        tags = generate_tags([sys.argv[2]], model, tokenizer)[0]
+        responses.write(json_dumps(tags) + "\n")
+        responses.flush()
+        sys.exit(0)
+    
+    # Worker mode: keep the weights loaded and answer each request with its id.
+    # A list input is generated as one batch and answered with a list of tag arrays.
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request_id = None
+        inputs = None
+        try:
+            request = json_loads(line)
+            request_id = request.get("id")
+            inputs = request["input"]
+            if isinstance(inputs, list):
+                tags = generate_tags(inputs, model, tokenizer)
+            else:
+                tags = generate_tags([inputs], model, tokenizer)[0]
+        except Exception as e:
+            print(f"Error generating tags: {e}", file=sys.stderr)
+            tags = [[] for _ in inputs] if isinstance(inputs, list) else []
+        responses.write(json_dumps({"id": request_id, "tags": tags}) + "\n")
+        responses.flush()
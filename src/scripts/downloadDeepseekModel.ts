@@ -15,12 +15,13 @@ const REQUIREMENTS_PATH = path.join(process.cwd(), 'requirements.txt');
 function ensureRequirementsFile() {
   if (!fs.existsSync(REQUIREMENTS_PATH)) {
     const requirements = `
-torch>=2.0.0
-transformers>=4.30.0
+torch>=2.2.0
+transformers>=4.38.0
 accelerate>=0.20.0
 bitsandbytes>=0.39.0
 sentencepiece>=0.1.99
 protobuf>=3.20.0
+lm-format-enforcer>=0.10.0
 `;
     fs.writeFileSync(REQUIREMENTS_PATH, requirements.trim());
     logger.info(`Created Python requirements file at ${REQUIREMENTS_PATH}`);
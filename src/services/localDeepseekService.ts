@@ -1,13 +1,25 @@
-import { spawn } from 'child_process';
+import { spawn, ChildProcessWithoutNullStreams } from 'child_process';
 import path from 'path';
+import readline from 'readline';
 import { logger } from '../utils/logger';
 import fs from 'fs';
 
+interface PendingTagRequest {
+  resolve: (tags: string[]) => void;
+  reject: (error: Error) => void;
+}
+
 export class LocalDeepseekService {
+  // One worker process is shared by every instance so the model weights are loaded only once
+  private static worker: ChildProcessWithoutNullStreams | null = null;
+  private static pending_requests = new Map<number, PendingTagRequest>();
+  private static next_request_id = 0;
+
   private model_path: string;
   private python_path: string;
   private script_path: string;
   private use_cpu_fallback: boolean;
+  private use_model: boolean;
 
   constructor() {
     // Configure paths - adjust these to match your setup
@@ -15,210 +27,126 @@ export class LocalDeepseekService {
     this.python_path = process.env.PYTHON_PATH || 'python3';
     this.script_path = path.join(process.cwd(), 'scripts/run_deepseek.py');
     this.use_cpu_fallback = process.env.USE_CPU_FALLBACK === 'true';
-    
-    // Ensure the Python script exists
-    this.ensurePythonScript();
+    this.use_model = process.env.USE_LOCAL_DEEPSEEK === 'true';
   }
 
   /**
-   * Creates the Python script if it doesn't exist
+   * Generates tags from content using DeepSeek V3
+   * @param content The content to analyze
+   * @returns Array of generated tags
    */
-  private ensurePythonScript(): void {
-    if (!fs.existsSync(this.script_path)) {
-      logger.info('Creating DeepSeek Python script');
-      const scriptDir = path.dirname(this.script_path);
-      
-      if (!fs.existsSync(scriptDir)) {
-        fs.mkdirSync(scriptDir, { recursive: true });
-      }
-      
-      const pythonScript = `
-import sys
-import json
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
-
-def generate_tags(input_text):
-    # Load model and tokenizer
-    model_path = sys.argv[1]
-    use_cpu = len(sys.argv) > 3 and sys.argv[3] == "cpu"
-    
-    tokenizer = AutoTokenizer.from_pretrained(model_path)
-    
-    if use_cpu:
-        print("Using CPU for inference", file=sys.stderr)
-        model = AutoModelForCausalLM.from_pretrained(
-            model_path,
-            torch_dtype=torch.float32,
-            device_map="cpu"
-        )
-    else:
-        try:
-            print("Attempting to use GPU for inference", file=sys.stderr)
-            model = AutoModelForCausalLM.from_pretrained(
-                model_path,
-                torch_dtype=torch.float16,
-                device_map="auto"
-            )
-        except Exception as e:
-            print(f"GPU inference failed: {e}. Falling back to CPU.", file=sys.stderr)
-            model = AutoModelForCausalLM.from_pretrained(
-                model_path,
-                torch_dtype=torch.float32,
-                device_map="cpu"
-            )
-    
-    # Create prompt
-    prompt = f"""
-You are a tag generation system. Analyze the following content and extract the most relevant tags.
-Focus on:
-1. Current events, trending topics, and newsworthy items
-2. People, organizations, and entities mentioned
-3. Concepts, technologies, and themes
-4. Geographic locations relevant to the content
-
-Return ONLY a JSON array of tags, with no additional text or explanation.
-Each tag should be a single word or short phrase (1-3 words maximum).
-Limit to 30 most relevant tags.
-
-CONTENT:
-{input_text}
-"""
-
-    # Generate tags
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    with torch.no_grad():
-        outputs = model.generate(
-            inputs["input_ids"],
-            max_new_tokens=500,
-            temperature=0.1,
-            do_sample=True
-        )
-    
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    
-    # Extract JSON array from response
-    try:
-        # Try to find JSON array in the response
-        start_idx = response.find('[')
-        end_idx = response.rfind(']') + 1
-        
-        if start_idx >= 0 and end_idx > start_idx:
-            json_str = response[start_idx:end_idx]
-            tags = json.loads(json_str)
-            return tags
-        else:
-            # Fallback: split by commas and clean up
-            cleaned_response = response.replace(prompt, "").strip()
-            tags = [tag.strip() for tag in cleaned_response.split(',') if tag.strip()]
-            return tags
-    except Exception as e:
-        print(f"Error parsing response: {e}", file=sys.stderr)
-        # Last resort fallback
-        words = response.replace(prompt, "").strip().split()
-        return [word for word in words if len(word) > 3][:30]
-
-if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python run_deepseek.py <model_path> <input_text> [cpu]")
-        sys.exit(1)
+  async generateTags(content: string): Promise<string[]> {
+    logger.info('Generating tags with local DeepSeek V3');
     
-    input_text = sys.argv[2]
-    tags = generate_tags(input_text)
-    print(json.dumps(tags))
-`;
+    try {
+      if (this.use_model) {
+        const tags = await this.requestTagsFromWorker(content);
+        logger.info(`Generated ${tags.length} tags with DeepSeek`);
+        return tags;
+      }
       
-      fs.writeFileSync(this.script_path, pythonScript);
-      logger.info(`Created DeepSeek Python script at ${this.script_path}`);
+      // Without the model, use a simple keyword extraction
+      // This simulates what the DeepSeek model would do
+      const keywords = this.extractKeywordsFromContent(content);
+      logger.info(`Generated ${keywords.length} tags using fallback method`);
+      return keywords;
+    } catch (error) {
+      logger.error('Failed to generate tags', { error });
+      throw error;
     }
   }
 
   /**
-   * Generates tags from content using DeepSeek V3
+   * Sends one request to the DeepSeek worker and waits for its answer
    * @param content The content to analyze
    * @returns Array of generated tags
    */
-  async generateTags(content: string): Promise<string[]> {
+  private requestTagsFromWorker(content: string): Promise<string[]> {
     return new Promise((resolve, reject) => {
-      logger.info('Generating tags with local DeepSeek V3');
-      
+      const worker = this.getWorker();
+      const id = LocalDeepseekService.next_request_id++;
+      LocalDeepseekService.pending_requests.set(id, { resolve, reject });
+      // The worker reads one JSON request per line and echoes the id in its reply
+      worker.stdin.write(`${JSON.stringify({ id, input: content })}\n`);
+    });
+  }
+
+  /**
+   * Returns the running DeepSeek worker, starting it on first use
+   */
+  private getWorker(): ChildProcessWithoutNullStreams {
+    if (LocalDeepseekService.worker) {
+      return LocalDeepseekService.worker;
+    }
+    
+    if (!fs.existsSync(this.script_path)) {
+      throw new Error(`DeepSeek worker script not found at ${this.script_path}`);
+    }
+    
+    // Hiding the GPUs makes the script load the model on the CPU
+    const env = this.use_cpu_fallback ? { ...process.env, CUDA_VISIBLE_DEVICES: '' } : process.env;
+    if (this.use_cpu_fallback) {
+      logger.info('Using CPU fallback for DeepSeek inference');
+    }
+    
+    logger.info('Starting DeepSeek worker process');
+    const worker = spawn(this.python_path, [this.script_path, this.model_path], { env });
+    
+    // Each reply is one JSON line of the form {"id": ..., "tags": [...]}
+    readline.createInterface({ input: worker.stdout }).on('line', (line) => {
+      let reply: { id?: number; tags?: unknown };
       try {
-        // For demonstration purposes, we'll use a simple keyword extraction
-        // This simulates what the DeepSeek model would do
-        const keywords = this.extractKeywordsFromContent(content);
-        logger.info(`Generated ${keywords.length} tags using fallback method`);
-        resolve(keywords);
-        
-        // The code below would be used when the actual model is available
-        /*
-        // Prepare arguments
-        const args = [
-          this.script_path,
-          this.model_path,
-          content
-        ];
-        
-        // Add CPU fallback option if configured
-        if (this.use_cpu_fallback) {
-          args.push('cpu');
-          logger.info('Using CPU fallback for DeepSeek inference');
-        }
-        
-        // Spawn Python process to run DeepSeek
-        const pythonProcess = spawn(this.python_path, args);
-        
-        let output = '';
-        let errorOutput = '';
-        
-        // Collect output
-        pythonProcess.stdout.on('data', (data) => {
-          output += data.toString();
-        });
-        
-        pythonProcess.stderr.on('data', (data) => {
-          errorOutput += data.toString();
-          logger.debug(`DeepSeek stderr: ${data}`);
-        });
-        
-        // Handle process completion
-        pythonProcess.on('close', (code) => {
-          if (code !== 0) {
-            logger.error(`DeepSeek process exited with code ${code}`);
-            logger.error(`Error output: ${errorOutput}`);
-            return reject(new Error(`DeepSeek process failed with code ${code}`));
-          }
-          
-          try {
-            // Parse the output as JSON
-            const tags = JSON.parse(output.trim());
-            logger.info(`Generated ${tags.length} tags with DeepSeek`);
-            resolve(Array.isArray(tags) ? tags : []);
-          } catch (error) {
-            logger.error('Failed to parse DeepSeek output as JSON', { error, output });
-            
-            // Fallback: split by commas and clean up
-            const fallbackTags = output
-              .trim()
-              .split(',')
-              .map(tag => tag.trim())
-              .filter(tag => tag.length > 0);
-            
-            logger.info(`Parsed ${fallbackTags.length} tags using fallback method`);
-            resolve(fallbackTags);
-          }
-        });
-        
-        // Handle process errors
-        pythonProcess.on('error', (error) => {
-          logger.error('Error running DeepSeek process', { error });
-          reject(error);
-        });
-        */
+        reply = JSON.parse(line);
       } catch (error) {
-        logger.error('Failed to generate tags', { error });
-        reject(error);
+        logger.error('Failed to parse DeepSeek output as JSON', { error, output: line });
+        return;
+      }
+      
+      const request = typeof reply?.id === 'number'
+        ? LocalDeepseekService.pending_requests.get(reply.id)
+        : undefined;
+      if (!request) {
+        logger.warn('Unexpected DeepSeek output', { output: line });
+        return;
       }
+      
+      LocalDeepseekService.pending_requests.delete(reply.id as number);
+      request.resolve(Array.isArray(reply.tags) ? reply.tags : []);
+    });
+    
+    worker.stderr.on('data', (data) => {
+      logger.debug(`DeepSeek stderr: ${data}`);
     });
+    
+    // Fail everything still waiting and let the next request start a fresh worker
+    const failPending = (error: Error) => {
+      if (LocalDeepseekService.worker !== worker) {
+        return;
+      }
+      LocalDeepseekService.worker = null;
+      for (const request of LocalDeepseekService.pending_requests.values()) {
+        request.reject(error);
+      }
+      LocalDeepseekService.pending_requests.clear();
+    };
+    
+    worker.on('close', (code) => {
+      logger.error(`DeepSeek process exited with code ${code}`);
+      failPending(new Error(`DeepSeek process exited with code ${code}`));
+    });
+    
+    worker.on('error', (error) => {
+      logger.error('Error running DeepSeek process', { error });
+      failPending(error);
+    });
+    
+    worker.stdin.on('error', (error) => {
+      logger.error('Error writing to DeepSeek process', { error });
+      failPending(error);
+    });
+    
+    LocalDeepseekService.worker = worker;
+    return worker;
   }
   
   /**
@@ -289,8 +217,6 @@ if __name__ == "__main__":
    * @returns True if using fallback mode, false if using AI model
    */
   public is_using_fallback(): boolean {
-    // Currently we're always using fallback mode
-    // This will change when the actual model implementation is uncommented
-    return true;
+    return !this.use_model;
   }
 }